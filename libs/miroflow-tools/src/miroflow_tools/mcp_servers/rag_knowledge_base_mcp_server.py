@@ -8,13 +8,32 @@ Provides tools for querying RAG (Retrieval-Augmented Generation) knowledge bases
 Supports vector search, document retrieval, and collection management.
 """
 
+import asyncio
 import os
-import json
 import logging
-from typing import Dict, Any
+import sys
+import time
+from typing import Dict, Any, Callable, List, Optional
 
+import anyio
 import httpx
+from cachetools import LRUCache, TTLCache
 from mcp.server.fastmcp import FastMCP
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+from .utils import (
+    clamp_search_params,
+    format_search_error,
+    format_search_success,
+    search_cache_key,
+)
+from .utils.fast_json import dumps, loads
 
 # Configure logging
 logger = logging.getLogger("miroflow")
@@ -23,10 +42,257 @@ logger = logging.getLogger("miroflow")
 RAG_API_URL = os.environ.get("RAG_API_URL", "http://localhost:8000")
 RAG_API_KEY = os.environ.get("RAG_API_KEY", "")
 
+# Search result cache: normalized (collection, top_k, threshold, query) ->
+# (results JSON array, count). The envelope is rebuilt on every hit so that the
+# response echoes the caller's own query text, not the one that filled the entry.
+# Cache reads and writes never span an await, so no lock is needed on the event loop.
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 300  # seconds
+_search_cache: TTLCache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+# Document cache: (collection, document_id) -> JSON response, bounded by the
+# total length of the cached responses rather than the number of entries
+DOC_CACHE_MAX_CHARS = 32 * 1024 * 1024
+_doc_cache: LRUCache = LRUCache(maxsize=DOC_CACHE_MAX_CHARS, getsizeof=len)
+
+# list_collections result cache; the lock lets one fetch serve concurrent misses
+COLLECTIONS_CACHE_TTL = 60  # seconds
+_collections_cache: Dict[str, Any] = {"ts": 0.0, "value": None}
+_collections_lock = asyncio.Lock()
+
+# Request headers, built once at import: auth is sent on every request by the
+# shared client, the content type only on requests with a JSON body
+_AUTH_HEADERS = {"Authorization": f"Bearer {RAG_API_KEY}"}
+_JSON_CONTENT_TYPE = {"Content-Type": "application/json"}
+
+# Input size limits, enforced before any network I/O
+MAX_QUERY_LEN = 4096
+MAX_DOCUMENT_ID_LEN = 256
+
+# Largest search response body accepted from the RAG API
+MAX_RESPONSE_BYTES = 16 * 1024 * 1024
+
+# Upper bound on concurrent backend searches when a batch is fanned out
+SEARCH_BATCH_CONCURRENCY = 16
+_search_semaphore = asyncio.Semaphore(SEARCH_BATCH_CONCURRENCY)
+
+# Cleared once the backend answers /api/search/batch with 404/405, so later
+# batches fan out directly instead of probing the endpoint again
+_batch_endpoint_available = True
+
+# Request timeouts: searches and document fetches use the client default
+# (_TIMEOUT_LONG); listing collections is expected to be quick
+_TIMEOUT_LONG = httpx.Timeout(None, connect=10, read=30)
+_TIMEOUT_SHORT = httpx.Timeout(None, connect=10, read=10)
+
+# Shared HTTP client: keeps pooled keep-alive connections to the RAG API
+# across tool calls instead of reconnecting on every request. The transport
+# retries failed connection attempts; status-level retries are done per call.
+# It is shared by every MCP session, so it is closed once at process exit
+# (_serve_stdio) rather than in a per-session lifespan.
+_client = httpx.AsyncClient(
+    base_url=RAG_API_URL,
+    headers=_AUTH_HEADERS,
+    timeout=_TIMEOUT_LONG,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        retries=2,
+    ),
+)
+
+
 # Initialize FastMCP server
 mcp = FastMCP("rag_knowledge_base")
 
 
+async def _read_capped(response: httpx.Response) -> bytes:
+    """Read a streamed response body, rejecting it once it exceeds MAX_RESPONSE_BYTES."""
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None and int(content_length) > MAX_RESPONSE_BYTES:
+        raise ValueError(f"Response too large: {content_length} bytes")
+    
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        buf += chunk
+        if len(buf) > MAX_RESPONSE_BYTES:
+            raise ValueError(f"Response exceeds {MAX_RESPONSE_BYTES} bytes")
+    return bytes(buf)
+
+
+class _HTTPError(Exception):
+    """Non-2xx response from the RAG API; the message is only built if it is displayed."""
+    
+    def __init__(self, status_code: int, response: httpx.Response) -> None:
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.response = response
+    
+    def __str__(self) -> str:
+        return f"RAG API returned HTTP {self.status_code} for {self.response.request.url.path}"
+
+
+def _check_status(response: httpx.Response) -> None:
+    """Raise _HTTPError unless the response has a 2xx status."""
+    status_code = response.status_code
+    if status_code >= 300:
+        raise _HTTPError(status_code, response)
+
+
+def _is_retryable_search_error(exc: BaseException) -> bool:
+    """Retry timeouts and HTTP 408, 429 and 5xx responses."""
+    if isinstance(exc, httpx.TimeoutException):
+        return True
+    if isinstance(exc, _HTTPError):
+        status_code = exc.status_code
+        return status_code >= 500 or status_code in (408, 429)
+    return False
+
+
+# Retry policy shared by the single and batch search requests
+_search_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1, max=4),
+    retry=retry_if_exception(_is_retryable_search_error),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+
+
+@_search_retry
+async def _post_search(body: str) -> bytes:
+    """POST a pre-serialized search request and return the raw response body."""
+    async with _client.stream(
+        "POST",
+        "/api/search",
+        content=body,
+        headers=_JSON_CONTENT_TYPE
+    ) as response:
+        _check_status(response)
+        return await _read_capped(response)
+
+
+@_search_retry
+async def _post_batch_search(body: str) -> Optional[bytes]:
+    """
+    POST a pre-serialized batch search request and return the raw response body.
+    
+    Returns None if the backend does not provide /api/search/batch (404/405).
+    """
+    async with _client.stream(
+        "POST",
+        "/api/search/batch",
+        content=body,
+        headers=_JSON_CONTENT_TYPE
+    ) as response:
+        if response.status_code in (404, 405):
+            return None
+        _check_status(response)
+        return await _read_capped(response)
+
+
+async def _do_search(
+    query: str, collection_name: str, top_k: int, score_threshold: float
+) -> str:
+    """Run a single search against the RAG API with caching and retries."""
+    # Validate inputs
+    if not query or not query.strip():
+        return dumps({
+            "success": False,
+            "error": "Query cannot be empty",
+            "query": query
+        })
+    
+    if len(query) > MAX_QUERY_LEN:
+        return dumps({
+            "success": False,
+            "error": f"Query exceeds {MAX_QUERY_LEN} characters",
+            "query": query[:200]
+        })
+    
+    cache_key = search_cache_key(query, collection_name, top_k, score_threshold)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        logger.info("RAG Search cache hit: query=%r, collection=%r", query, collection_name)
+        return format_search_success(query, collection_name, *cached)
+    
+    logger.info("RAG Search: query=%r, collection=%r, top_k=%d", query, collection_name, top_k)
+    
+    try:
+        # Serialize the request body once; retries reuse it
+        body = dumps({
+            "query": query,
+            "collection_name": collection_name,
+            "top_k": top_k,
+            "score_threshold": score_threshold
+        })
+        
+        content = await _post_search(body)
+        
+        # Parse response
+        result_data = loads(content)
+        documents = result_data.get("documents", [])
+        
+        logger.info("RAG Search success: %d results", len(documents))
+        
+        results_json = dumps(documents)
+        _search_cache[cache_key] = (results_json, len(documents))
+        return format_search_success(query, collection_name, results_json, len(documents))
+        
+    except Exception as e:
+        logger.error("RAG Search error: %s", e)
+        
+        return format_search_error(query, collection_name, str(e))
+
+
+async def _do_search_bounded(
+    query: str, collection_name: str, top_k: int, score_threshold: float
+) -> str:
+    """Run a single search while holding a slot of the fan-out semaphore."""
+    async with _search_semaphore:
+        return await _do_search(query, collection_name, top_k, score_threshold)
+
+
+async def _batch_search_endpoint(
+    queries: List[str], collection_name: str, top_k: int, score_threshold: float
+) -> Optional[List[str]]:
+    """
+    Search several queries with a single POST to /api/search/batch.
+    
+    The endpoint is expected to return {"results": [{"documents": [...]}, ...]}
+    in the same order as the queries. Returns None if the backend does not
+    provide a batch endpoint.
+    """
+    global _batch_endpoint_available
+    if not _batch_endpoint_available:
+        return None
+    
+    content = await _post_batch_search(dumps({
+        "queries": queries,
+        "collection_name": collection_name,
+        "top_k": top_k,
+        "score_threshold": score_threshold
+    }))
+    if content is None:
+        logger.info("RAG Batch Search: backend has no batch endpoint, using per-query searches")
+        _batch_endpoint_available = False
+        return None
+    
+    batch_results = loads(content).get("results", [])
+    if len(batch_results) != len(queries):
+        raise ValueError(
+            f"Batch search returned {len(batch_results)} results for {len(queries)} queries"
+        )
+    
+    results = []
+    for query, item in zip(queries, batch_results):
+        documents = item.get("documents", [])
+        fragment = (dumps(documents), len(documents))
+        _search_cache[search_cache_key(query, collection_name, top_k, score_threshold)] = fragment
+        results.append(format_search_success(query, collection_name, *fragment))
+    return results
+
+
 @mcp.tool()
 async def search_knowledge_base(
     query: str,
@@ -61,97 +327,92 @@ async def search_knowledge_base(
             top_k=3
         )
     """
-    # Validate inputs
-    if not query or not query.strip():
-        return json.dumps({
+    top_k, score_threshold = clamp_search_params(top_k, score_threshold)
+    
+    return await _do_search(query, collection_name, top_k, score_threshold)
+
+
+@mcp.tool()
+async def search_knowledge_base_batch(
+    queries: List[str],
+    collection_name: str = "default",
+    top_k: int = 5,
+    score_threshold: float = 0.7
+) -> str:
+    """
+    Search the RAG knowledge base for several independent queries at once.
+    
+    Use this tool instead of calling search_knowledge_base repeatedly when you
+    have multiple unrelated questions for the same collection.
+    
+    Args:
+        queries (list[str]): The search queries
+        collection_name (str): Name of the knowledge base collection to search (default: "default")
+        top_k (int): Maximum number of results to return per query (default: 5, max: 20)
+        score_threshold (float): Minimum relevance score 0-1 (default: 0.7, higher = more relevant)
+    
+    Returns:
+        str: JSON string containing:
+            - success (bool): Whether the batch was executed
+            - collection (str): Collection that was searched
+            - results (list): One search_knowledge_base result per query, in order
+            - count (int): Number of queries processed
+    """
+    if not queries:
+        return dumps({
             "success": False,
-            "error": "Query cannot be empty",
-            "query": query
-        }, ensure_ascii=False)
+            "error": "Queries cannot be empty",
+            "collection": collection_name
+        })
     
-    # Validate top_k
-    top_k = min(max(1, top_k), 20)  # Clamp between 1 and 20
+    top_k, score_threshold = clamp_search_params(top_k, score_threshold)
     
-    # Validate score_threshold
-    score_threshold = min(max(0.0, score_threshold), 1.0)  # Clamp between 0 and 1
+    logger.info(
+        "RAG Batch Search: %d queries, collection=%r, top_k=%d",
+        len(queries), collection_name, top_k
+    )
     
-    logger.info(f"RAG Search: query='{query}', collection='{collection_name}', top_k={top_k}")
+    # Only well-formed queries that miss the cache go to the backend
+    results: List[Optional[str]] = [None] * len(queries)
+    pending: List[int] = []
+    for i, query in enumerate(queries):
+        if query and query.strip() and len(query) <= MAX_QUERY_LEN:
+            cached = _search_cache.get(
+                search_cache_key(query, collection_name, top_k, score_threshold)
+            )
+            if cached is None:
+                pending.append(i)
+            else:
+                results[i] = format_search_success(query, collection_name, *cached)
+        else:
+            # Empty or oversized: rejected locally by _do_search's validation
+            results[i] = await _do_search(query, collection_name, top_k, score_threshold)
     
-    try:
-        # Retry configuration
-        retry_delays = [1, 2, 4]
-        
-        for attempt, delay in enumerate(retry_delays, 1):
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{RAG_API_URL}/api/search",
-                        headers={
-                            "Authorization": f"Bearer {RAG_API_KEY}",
-                            "Content-Type": "application/json"
-                        },
-                        json={
-                            "query": query,
-                            "collection_name": collection_name,
-                            "top_k": top_k,
-                            "score_threshold": score_threshold
-                        },
-                        timeout=httpx.Timeout(None, connect=10, read=30)
-                    )
-                    
-                    response.raise_for_status()
-                    break  # Success, exit retry loop
-                    
-            except httpx.TimeoutException as e:
-                if attempt < len(retry_delays):
-                    logger.warning(f"RAG Search timeout, retry in {delay}s (attempt {attempt})")
-                    await asyncio.sleep(delay)
-                    continue
-                else:
-                    logger.error("RAG Search timeout after retries")
-                    raise e
-                    
-            except httpx.HTTPStatusError as e:
-                status_code = e.response.status_code
-                
-                # Retryable errors: 5xx, 408, 429
-                if status_code >= 500 or status_code in [408, 429]:
-                    if attempt < len(retry_delays):
-                        logger.warning(f"RAG Search HTTP {status_code}, retry in {delay}s")
-                        await asyncio.sleep(delay)
-                        continue
-                    else:
-                        logger.error(f"RAG Search HTTP {status_code} after retries")
-                        raise e
-                else:
-                    # Non-retryable errors: 4xx (except 408, 429)
-                    logger.error(f"RAG Search HTTP {status_code} (non-retryable)")
-                    raise e
-        
-        # Parse response
-        result_data = response.json()
-        documents = result_data.get("documents", [])
-        
-        logger.info(f"RAG Search success: {len(documents)} results")
-        
-        return json.dumps({
-            "success": True,
-            "query": query,
-            "collection": collection_name,
-            "results": documents,
-            "count": len(documents)
-        }, ensure_ascii=False)
+    if pending:
+        pending_queries = [queries[i] for i in pending]
+        try:
+            fetched = await _batch_search_endpoint(
+                pending_queries, collection_name, top_k, score_threshold
+            )
+        except Exception as e:
+            logger.error("RAG Batch Search error: %s", e)
+            fetched = [format_search_error(q, collection_name, str(e)) for q in pending_queries]
         
-    except Exception as e:
-        error_msg = f"RAG Search error: {str(e)}"
-        logger.error(error_msg)
+        if fetched is None:
+            # No batch endpoint on the backend: fan out single searches concurrently
+            fetched = await asyncio.gather(*[
+                _do_search_bounded(q, collection_name, top_k, score_threshold)
+                for q in pending_queries
+            ])
         
-        return json.dumps({
-            "success": False,
-            "error": str(e),
-            "query": query,
-            "collection": collection_name
-        }, ensure_ascii=False)
+        for i, result in zip(pending, fetched):
+            results[i] = result
+    
+    # Each per-query result is already a JSON object; splice them into the envelope
+    return (
+        f'{{"success":true,"collection":{dumps(collection_name)},'
+        f'"results":[{",".join(results)}],"count":{len(results)}}}'
+    )
 
 
 @mcp.tool()
@@ -176,41 +437,91 @@ async def get_document(
             - error (str): Error message if failed
     """
     if not document_id or not document_id.strip():
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": "Document ID cannot be empty"
-        }, ensure_ascii=False)
+        })
+    
+    if len(document_id) > MAX_DOCUMENT_ID_LEN:
+        return dumps({
+            "success": False,
+            "error": f"Document ID exceeds {MAX_DOCUMENT_ID_LEN} characters",
+            "document_id": document_id[:200]
+        })
+    
+    cache_key = (collection_name, document_id)
+    cached = _doc_cache.get(cache_key)
+    if cached is not None:
+        logger.info("RAG Get Document cache hit: id=%r, collection=%r", document_id, collection_name)
+        return cached
     
-    logger.info(f"RAG Get Document: id='{document_id}', collection='{collection_name}'")
+    logger.info("RAG Get Document: id=%r, collection=%r", document_id, collection_name)
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{RAG_API_URL}/api/document/{document_id}",
-                headers={"Authorization": f"Bearer {RAG_API_KEY}"},
-                params={"collection": collection_name},
-                timeout=httpx.Timeout(None, connect=10, read=30)
-            )
-            
-            response.raise_for_status()
-            document = response.json()
-            
-            logger.info(f"RAG Get Document success: {document_id}")
-            
-            return json.dumps({
-                "success": True,
-                "document": document
-            }, ensure_ascii=False)
+        response = await _client.get(
+            f"/api/document/{document_id}",
+            params={"collection": collection_name}
+        )
+        
+        _check_status(response)
+        document = loads(response.content)
+        
+        logger.info("RAG Get Document success: %s", document_id)
+        
+        result = dumps({
+            "success": True,
+            "document": document
+        })
+        # Documents larger than the whole cache budget are returned uncached
+        if len(result) <= DOC_CACHE_MAX_CHARS:
+            _doc_cache[cache_key] = result
+        return result
             
     except Exception as e:
-        error_msg = f"RAG Get Document error: {str(e)}"
-        logger.error(error_msg)
+        logger.error("RAG Get Document error: %s", e)
         
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": str(e),
             "document_id": document_id
-        }, ensure_ascii=False)
+        })
+
+
+@mcp.tool()
+async def invalidate_document(document_id: str) -> str:
+    """
+    Drop a document from the local document cache in every collection.
+    
+    Use this tool after a document has been updated in the knowledge base so that
+    the next get_document call fetches the fresh version.
+    
+    Args:
+        document_id (str): Unique identifier of the document
+    
+    Returns:
+        str: JSON string containing:
+            - success (bool): Whether the operation was successful
+            - document_id (str): The document that was invalidated
+            - evicted (int): Number of cache entries removed
+    """
+    stale_keys = [key for key in _doc_cache.keys() if key[1] == document_id]
+    for key in stale_keys:
+        del _doc_cache[key]
+    
+    logger.info("RAG Invalidate Document: id=%r, evicted=%d", document_id, len(stale_keys))
+    
+    return dumps({
+        "success": True,
+        "document_id": document_id,
+        "evicted": len(stale_keys)
+    })
+
+
+def _get_cached_collections() -> Optional[str]:
+    """Return the cached list_collections result if it is still fresh."""
+    if time.monotonic() - _collections_cache["ts"] < COLLECTIONS_CACHE_TTL:
+        return _collections_cache["value"]
+    return None
 
 
 @mcp.tool()
@@ -226,38 +537,73 @@ async def list_collections() -> str:
             - collections (list): List of available collections with metadata
             - error (str): Error message if failed
     """
-    logger.info("RAG List Collections")
+    cached = _get_cached_collections()
+    if cached is not None:
+        return cached
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{RAG_API_URL}/api/collections",
-                headers={"Authorization": f"Bearer {RAG_API_KEY}"},
-                timeout=httpx.Timeout(None, connect=10, read=10)
+    async with _collections_lock:
+        # Another caller may have refreshed the cache while we waited
+        cached = _get_cached_collections()
+        if cached is not None:
+            return cached
+        
+        logger.info("RAG List Collections")
+        
+        try:
+            response = await _client.get(
+                "/api/collections",
+                timeout=_TIMEOUT_SHORT
             )
             
-            response.raise_for_status()
-            collections_data = response.json()
+            _check_status(response)
+            collections_data = loads(response.content)
             
             collections = collections_data.get("collections", [])
-            logger.info(f"RAG List Collections success: {len(collections)} collections")
+            logger.info("RAG List Collections success: %d collections", len(collections))
             
-            return json.dumps({
+            result = dumps({
                 "success": True,
                 "collections": collections
-            }, ensure_ascii=False)
+            })
+            _collections_cache["ts"] = time.monotonic()
+            _collections_cache["value"] = result
+            return result
+                
+        except Exception as e:
+            logger.error("RAG List Collections error: %s", e)
             
-    except Exception as e:
-        error_msg = f"RAG List Collections error: {str(e)}"
-        logger.error(error_msg)
-        
-        return json.dumps({
-            "success": False,
-            "error": str(e)
-        }, ensure_ascii=False)
+            return dumps({
+                "success": False,
+                "error": str(e)
+            })
+
+
+def _fast_loop_factory() -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    """
+    Return winloop's (Windows) or uvloop's event loop factory, or None if it is not installed.
+    
+    Handed to anyio as loop_factory rather than setting use_uvloop, which only
+    imports uvloop on the anyio versions the apps lock.
+    """
+    try:
+        if sys.platform == "win32":
+            import winloop as fast_loop
+        else:
+            import uvloop as fast_loop
+    except ImportError:
+        return None
+    return fast_loop.new_event_loop
+
+
+async def _serve_stdio() -> None:
+    """Serve the MCP server over stdio, then close the shared HTTP client."""
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        await _client.aclose()
 
 
 if __name__ == "__main__":
-    # Run the MCP server
-    import asyncio
-    mcp.run(transport="stdio")
+    # Run the MCP server over stdio, as mcp.run(transport="stdio") does, but on
+    # uvloop/winloop when available
+    anyio.run(_serve_stdio, backend_options={"loop_factory": _fast_loop_factory()})
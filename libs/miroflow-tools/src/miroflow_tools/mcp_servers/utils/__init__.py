@@ -1,7 +1,17 @@
+from .rag_format import (
+    clamp_search_params,
+    format_search_error,
+    format_search_success,
+    search_cache_key,
+)
 from .url_unquote import decode_http_urls_in_dict, safe_unquote, strip_markdown_links
 
 __all__ = [
     "safe_unquote",
     "decode_http_urls_in_dict",
     "strip_markdown_links",
+    "clamp_search_params",
+    "search_cache_key",
+    "format_search_success",
+    "format_search_error",
 ]
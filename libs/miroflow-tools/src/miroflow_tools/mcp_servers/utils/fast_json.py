@@ -0,0 +1,42 @@
+"""
+JSON encode/decode helpers backed by the fastest available library.
+
+Prefers orjson, then ujson, then the standard library. ``dumps`` always
+returns a compact ``str`` with non-ASCII characters kept as-is, and ``loads``
+accepts either ``str`` or ``bytes``.
+
+``dumps`` returns ``str`` rather than orjson's native ``bytes`` on purpose:
+FastMCP embeds tool results as text inside the JSON-RPC message, so a
+``bytes`` return value would be re-encoded as a JSON string instead of being
+passed through. Callers should hand raw response bytes straight to ``loads``.
+"""
+
+from typing import Any, Callable
+
+dumps: Callable[[Any], str]
+loads: Callable[[str | bytes], Any]
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    loads = orjson.loads
+
+except ImportError:
+    try:
+        import ujson
+
+        def dumps(obj: Any) -> str:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+        loads = ujson.loads
+
+    except ImportError:
+        import json
+
+        def dumps(obj: Any) -> str:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+        loads = json.loads
@@ -0,0 +1,57 @@
+"""
+Pure helpers for the RAG knowledge base MCP server: parameter clamping, cache
+keys and response assembly.
+
+Kept free of I/O and dynamic features so this module can be compiled with
+mypyc (see the opt-in mypyc build hook in pyproject.toml); the plain Python
+source is used when it is not compiled.
+"""
+
+from typing import Tuple
+
+from .fast_json import dumps
+
+
+def clamp_search_params(top_k: int, score_threshold: float) -> Tuple[int, float]:
+    """Clamp top_k to [1, 20] and score_threshold to [0, 1]; a NaN threshold becomes 0."""
+    # "not >=" rather than "<" so that NaN also maps to 0.0
+    if not score_threshold >= 0.0:
+        score_threshold = 0.0
+    elif score_threshold > 1.0:
+        score_threshold = 1.0
+    return 1 if top_k < 1 else 20 if top_k > 20 else top_k, score_threshold
+
+
+def search_cache_key(
+    query: str, collection_name: str, top_k: int, score_threshold: float
+) -> Tuple[str, int, float, str]:
+    """Build the search cache key; the query is normalized so trivial variants share an entry."""
+    return (collection_name, top_k, round(score_threshold, 3), query.strip().lower())
+
+
+def format_search_success(
+    query: str, collection_name: str, results_json: str, count: int
+) -> str:
+    """
+    Serialize a successful search result in the tool's response format.
+
+    results_json is the already-encoded JSON array of documents, so cached
+    results can be reused with the current caller's query.
+    """
+    # Assembled directly rather than building an envelope dict just to encode it
+    return (
+        f'{{"success":true,"query":{dumps(query)},"collection":{dumps(collection_name)},'
+        f'"results":{results_json},"count":{count}}}'
+    )
+
+
+def format_search_error(query: str, collection_name: str, error: str) -> str:
+    """Serialize a failed search result in the tool's response format."""
+    return dumps(
+        {
+            "success": False,
+            "error": error,
+            "query": query,
+            "collection": collection_name,
+        }
+    )
@@ -0,0 +1,82 @@
+"""
+Unit tests for the RAG knowledge base response helpers.
+
+Run with: pytest src/test/test_rag_format.py -v
+"""
+
+import json
+import math
+
+import pytest
+
+from miroflow_tools.mcp_servers.utils.rag_format import (
+    clamp_search_params,
+    format_search_error,
+    format_search_success,
+    search_cache_key,
+)
+
+pytestmark = pytest.mark.unit
+
+
+class TestFormatSearchResults:
+    """Envelope assembly for search_knowledge_base results."""
+
+    def test_success_envelope(self):
+        result = json.loads(format_search_success("产品", "kb", '[{"id":"1"}]', 1))
+        assert result == {
+            "success": True,
+            "query": "产品",
+            "collection": "kb",
+            "results": [{"id": "1"}],
+            "count": 1,
+        }
+
+    def test_success_envelope_escapes_query(self):
+        result = json.loads(format_search_success('say "hi"\n', "kb", "[]", 0))
+        assert result["query"] == 'say "hi"\n'
+
+    def test_error_envelope(self):
+        assert json.loads(format_search_error("q", "kb", "boom")) == {
+            "success": False,
+            "error": "boom",
+            "query": "q",
+            "collection": "kb",
+        }
+
+
+class TestSearchParams:
+    """Parameter clamping and cache keys."""
+
+    @pytest.mark.parametrize(
+        "top_k, expected",
+        [(-3, 1), (0, 1), (1, 1), (7, 7), (20, 20), (21, 20)],
+    )
+    def test_clamp_top_k(self, top_k, expected):
+        assert clamp_search_params(top_k, 0.5)[0] == expected
+
+    @pytest.mark.parametrize(
+        "threshold, expected",
+        [
+            (-0.1, 0.0),
+            (0.0, 0.0),
+            (0.7, 0.7),
+            (1.5, 1.0),
+            (math.inf, 1.0),
+            (-math.inf, 0.0),
+            (math.nan, 0.0),
+        ],
+    )
+    def test_clamp_score_threshold(self, threshold, expected):
+        assert clamp_search_params(5, threshold)[1] == expected
+
+    def test_cache_key_normalizes_query(self):
+        assert search_cache_key("  Hello ", "kb", 5, 0.7) == search_cache_key(
+            "hello", "kb", 5, 0.7
+        )
+
+    def test_cache_key_separates_parameters(self):
+        base = search_cache_key("q", "kb", 5, 0.7)
+        assert base != search_cache_key("q", "other", 5, 0.7)
+        assert base != search_cache_key("q", "kb", 6, 0.7)
+        assert base != search_cache_key("q", "kb", 5, 0.8)
@@ -0,0 +1,264 @@
+"""
+Unit tests for the RAG knowledge base MCP server tools, run against a mocked RAG API.
+
+Run with: pytest src/test/test_rag_knowledge_base_mcp_server.py -v
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from tenacity import wait_none
+
+from miroflow_tools.mcp_servers import rag_knowledge_base_mcp_server as rag
+
+pytestmark = pytest.mark.unit
+
+
+class MockRagApi:
+    """Routes requests to per-path handlers and records what was sent."""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+    def on(self, method, path, *responses):
+        """Serve the given responses in order; the last one repeats."""
+        self.routes[(method, path)] = list(responses)
+
+    def calls(self, method, path):
+        return [r for r in self.requests if (r.method, r.url.path) == (method, path)]
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        responses = self.routes.get((request.method, request.url.path))
+        if not responses:
+            return httpx.Response(404)
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Point the server's shared client at a MockRagApi and reset all module state."""
+    mock = MockRagApi()
+    monkeypatch.setattr(
+        rag,
+        "_client",
+        httpx.AsyncClient(
+            base_url=rag.RAG_API_URL, transport=httpx.MockTransport(mock)
+        ),
+    )
+    monkeypatch.setattr(rag, "_batch_endpoint_available", True)
+    monkeypatch.setattr(rag, "_collections_lock", asyncio.Lock())
+    monkeypatch.setattr(
+        rag, "_search_semaphore", asyncio.Semaphore(rag.SEARCH_BATCH_CONCURRENCY)
+    )
+    monkeypatch.setattr(rag, "_collections_cache", {"ts": 0.0, "value": None})
+    monkeypatch.setattr(rag._post_search.retry, "wait", wait_none())
+    monkeypatch.setattr(rag._post_batch_search.retry, "wait", wait_none())
+    rag._search_cache.clear()
+    rag._doc_cache.clear()
+    yield mock
+    rag._search_cache.clear()
+    rag._doc_cache.clear()
+
+
+def _documents(*ids):
+    return httpx.Response(200, json={"documents": [{"id": i} for i in ids]})
+
+
+class TestSearchKnowledgeBase:
+    """Tests for search_knowledge_base."""
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_echoes_callers_query(self, api):
+        api.on("POST", "/api/search", _documents("1"))
+
+        first = json.loads(await rag.search_knowledge_base("Hello"))
+        second = json.loads(await rag.search_knowledge_base("  hello "))
+
+        assert len(api.calls("POST", "/api/search")) == 1
+        assert first["query"] == "Hello"
+        assert second["query"] == "  hello "
+        assert second["results"] == first["results"] == [{"id": "1"}]
+        assert second["count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_response(self, api, monkeypatch):
+        monkeypatch.setattr(rag, "MAX_RESPONSE_BYTES", 64)
+        api.on(
+            "POST",
+            "/api/search",
+            httpx.Response(200, json={"documents": [{"content": "x" * 100}]}),
+        )
+
+        result = json.loads(await rag.search_knowledge_base("q"))
+
+        assert result["success"] is False
+
+    @pytest.mark.asyncio
+    async def test_retries_retryable_status(self, api):
+        api.on("POST", "/api/search", httpx.Response(503), _documents("1"))
+
+        result = json.loads(await rag.search_knowledge_base("q"))
+
+        assert result["success"] is True
+        assert len(api.calls("POST", "/api/search")) == 2
+
+    @pytest.mark.asyncio
+    async def test_does_not_retry_client_error_or_cache_failure(self, api):
+        api.on("POST", "/api/search", httpx.Response(400))
+
+        for _ in range(2):
+            result = json.loads(await rag.search_knowledge_base("q"))
+            assert result["success"] is False
+
+        assert len(api.calls("POST", "/api/search")) == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_query_locally(self, api):
+        result = json.loads(
+            await rag.search_knowledge_base("x" * (rag.MAX_QUERY_LEN + 1))
+        )
+
+        assert result["success"] is False
+        assert api.requests == []
+
+
+class TestSearchKnowledgeBaseBatch:
+    """Tests for search_knowledge_base_batch."""
+
+    @pytest.mark.asyncio
+    async def test_merges_cache_hits_rejections_and_batch_results_in_order(self, api):
+        api.on("POST", "/api/search", _documents("cached"))
+        await rag.search_knowledge_base("Cached")
+        api.on(
+            "POST",
+            "/api/search/batch",
+            httpx.Response(
+                200,
+                json={"results": [{"documents": [{"id": "a"}]}, {"documents": []}]},
+            ),
+        )
+
+        result = json.loads(
+            await rag.search_knowledge_base_batch(["a", "", "CACHED", "b"])
+        )
+
+        batch_calls = api.calls("POST", "/api/search/batch")
+        assert len(batch_calls) == 1
+        assert json.loads(batch_calls[0].content)["queries"] == ["a", "b"]
+        assert result["count"] == 4
+        a, empty, cached, b = result["results"]
+        assert (a["query"], a["results"]) == ("a", [{"id": "a"}])
+        assert empty["success"] is False
+        assert (cached["query"], cached["results"]) == ("CACHED", [{"id": "cached"}])
+        assert (b["query"], b["count"]) == ("b", 0)
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_single_searches_and_remembers_missing_endpoint(
+        self, api
+    ):
+        api.on("POST", "/api/search/batch", httpx.Response(404))
+        api.on("POST", "/api/search", _documents("1"))
+
+        first = json.loads(await rag.search_knowledge_base_batch(["q1", "q2"]))
+        second = json.loads(await rag.search_knowledge_base_batch(["q3"]))
+
+        assert len(api.calls("POST", "/api/search/batch")) == 1
+        assert len(api.calls("POST", "/api/search")) == 3
+        assert [r["query"] for r in first["results"]] == ["q1", "q2"]
+        assert second["results"][0]["success"] is True
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_batch_response(self, api, monkeypatch):
+        monkeypatch.setattr(rag, "MAX_RESPONSE_BYTES", 64)
+        api.on(
+            "POST",
+            "/api/search/batch",
+            httpx.Response(
+                200, json={"results": [{"documents": [{"content": "x" * 100}]}]}
+            ),
+        )
+
+        result = json.loads(await rag.search_knowledge_base_batch(["q"]))
+
+        assert result["results"][0]["success"] is False
+
+    @pytest.mark.asyncio
+    async def test_retries_batch_endpoint(self, api):
+        api.on(
+            "POST",
+            "/api/search/batch",
+            httpx.Response(503),
+            httpx.Response(200, json={"results": [{"documents": []}]}),
+        )
+
+        result = json.loads(await rag.search_knowledge_base_batch(["q"]))
+
+        assert result["results"][0]["success"] is True
+        assert len(api.calls("POST", "/api/search/batch")) == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_queries_locally(self, api):
+        api.on(
+            "POST",
+            "/api/search/batch",
+            httpx.Response(200, json={"results": [{"documents": []}]}),
+        )
+
+        result = json.loads(
+            await rag.search_knowledge_base_batch(["x" * (rag.MAX_QUERY_LEN + 1), "q"])
+        )
+
+        batch_calls = api.calls("POST", "/api/search/batch")
+        assert json.loads(batch_calls[0].content)["queries"] == ["q"]
+        too_long, q = result["results"]
+        assert too_long["success"] is False
+        assert q["success"] is True
+
+
+class TestGetDocument:
+    """Tests for get_document and invalidate_document."""
+
+    @pytest.mark.asyncio
+    async def test_document_cache_and_invalidation(self, api):
+        api.on("GET", "/api/document/d1", httpx.Response(200, json={"id": "d1"}))
+
+        await rag.get_document("d1")
+        cached = json.loads(await rag.get_document("d1"))
+        assert cached == {"success": True, "document": {"id": "d1"}}
+        assert len(api.calls("GET", "/api/document/d1")) == 1
+
+        invalidated = json.loads(await rag.invalidate_document("d1"))
+        assert invalidated["evicted"] == 1
+        await rag.get_document("d1")
+        assert len(api.calls("GET", "/api/document/d1")) == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_document_id_locally(self, api):
+        result = json.loads(await rag.get_document("d" * (rag.MAX_DOCUMENT_ID_LEN + 1)))
+
+        assert result["success"] is False
+        assert api.requests == []
+
+
+class TestListCollections:
+    """Tests for list_collections."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_list_collections_share_one_fetch(self, api):
+        api.on(
+            "GET",
+            "/api/collections",
+            httpx.Response(200, json={"collections": [{"name": "kb"}]}),
+        )
+
+        results = await asyncio.gather(*[rag.list_collections() for _ in range(5)])
+
+        assert len(api.calls("GET", "/api/collections")) == 1
+        assert all(json.loads(r)["collections"] == [{"name": "kb"}] for r in results)